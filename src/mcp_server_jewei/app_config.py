@@ -19,14 +19,60 @@ class Config:
     DB_NAME = os.getenv("DB_NAME", "master")
     DB_PORT = os.getenv("DB_PORT", "1433")
     
+    # 连接意图（ReadOnly/ReadWrite），为空时不设置；可用性组配置了只读路由时，
+    # 设为ReadOnly会把连接路由到只读副本（副本数据可能有延迟）
+    DB_APPLICATION_INTENT = os.getenv("DB_APPLICATION_INTENT", "")
+    
+    # 连接池配置
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_WARM_UP = os.getenv("DB_POOL_WARM_UP", "true").lower() in ("1", "true", "yes")
+    
+    # 查询配置
+    QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "1000"))
+    # 调用方可指定的max_rows上限，避免一次读取过多的行
+    QUERY_MAX_ROWS_LIMIT = int(os.getenv("QUERY_MAX_ROWS_LIMIT", "10000"))
+    QUERY_LOCK_TIMEOUT_MS = int(os.getenv("QUERY_LOCK_TIMEOUT_MS", "5000"))
+    
+    # 元数据缓存配置（秒）
+    METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", "300"))
+    # 表列表变化更频繁（新建、删除表），使用较短的缓存时间
+    TABLE_LIST_CACHE_TTL = int(os.getenv("TABLE_LIST_CACHE_TTL", "60"))
+    DATABASE_INFO_CACHE_TTL = int(os.getenv("DATABASE_INFO_CACHE_TTL", "3600"))
+    # 缓存条目上限，避免架构、表很多时缓存无限增长
+    METADATA_CACHE_MAXSIZE = int(os.getenv("METADATA_CACHE_MAXSIZE", "256"))
+    
     # 服务器配置
     SERVER_NAME = os.getenv("SERVER_NAME", "JEWEI-MSSQL-Server")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+    
+    # 传输配置：stdio（默认）或 http（Streamable HTTP，通过uvicorn运行）
+    MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").lower()
+    MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+    MCP_PORT = int(os.getenv("MCP_PORT", "9000"))
+    MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
     
     # 连接字符串
     @property
     def CONNECTION_STRING(self):
-        """构建数据库连接字符串"""
-        return f"mssql+pyodbc://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}?driver=SQL+Server&timeout=30&trusted_connection=no&encrypt=no"
+        """构建数据库连接字符串
+        
+        - MARS_Connection=no：显式关闭MARS
+        - Packet Size=32767：增大TDS包大小，减少读取大结果集时的网络往返
+        - ApplicationIntent：仅在配置了DB_APPLICATION_INTENT时添加
+        
+        注意：默认的旧版"SQL Server"驱动不支持MARS_Connection和ApplicationIntent，
+        需要将driver改为"ODBC Driver 17/18 for SQL Server"才会生效
+        """
+        connection_string = (
+            f"mssql+pyodbc://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+            f"?driver=SQL+Server&timeout=30&trusted_connection=no&encrypt=no"
+            f"&MARS_Connection=no&Packet+Size=32767"
+        )
+        if self.DB_APPLICATION_INTENT:
+            connection_string += f"&ApplicationIntent={self.DB_APPLICATION_INTENT}"
+        return connection_string
 
 # 创建默认配置实例
 config = Config()
\ No newline at end of file
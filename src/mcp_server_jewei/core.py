@@ -3,131 +3,562 @@
 核心模块，包含数据库连接和核心功能
 """
 
-import json
-from typing import Dict, List, Optional, Union, Any
-from sqlalchemy import create_engine, text, MetaData, Table, Column
+import datetime
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple, Any
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.tokens import TokenType
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 
 from .app_config import config
 
+logger = logging.getLogger(__name__)
+
 # 数据库连接管理
 engine = None
+_engine_lock = threading.Lock()
+
+# 测试连接用的语句
+_PING_SQL = text("SELECT 1")
+
+# SQL Server标识符（sysname）的最大长度
+_MAX_IDENTIFIER_LENGTH = 128
+
+def _validate_identifier(name: str, kind: str) -> Optional[str]:
+    """校验表名、架构名等标识符，合法时返回None，否则返回错误信息
+    
+    元数据查询中的名称都以参数绑定，这里只拒绝空值和超长的名称；
+    以数字开头、包含连字符或点号的分隔标识符（如 2023_sales、order-items）都是合法表名
+    """
+    if not isinstance(name, str) or not 0 < len(name) <= _MAX_IDENTIFIER_LENGTH:
+        return f"非法的{kind}: {name!r}"
+    return None
+
+# 元数据缓存，键为 (类型, 架构, 表名...)，值为 (写入时间, 结果)
+_metadata_cache: Dict[Tuple[str, ...], Tuple[float, Dict[str, Any]]] = {}
+_metadata_cache_lock = threading.RLock()
+
+def _cache_get(key: Tuple[str, ...], ttl: float) -> Optional[Dict[str, Any]]:
+    """从元数据缓存中读取未过期的结果，过期或不存在时返回None"""
+    with _metadata_cache_lock:
+        entry = _metadata_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > ttl:
+            del _metadata_cache[key]
+            return None
+        return value
+
+def _cache_set(key: Tuple[str, ...], value: Dict[str, Any]) -> None:
+    """写入元数据缓存，超出容量时淘汰最早写入的条目"""
+    with _metadata_cache_lock:
+        # 先删除再插入，使字典顺序始终与写入时间一致
+        _metadata_cache.pop(key, None)
+        _metadata_cache[key] = (time.monotonic(), value)
+        while len(_metadata_cache) > config.METADATA_CACHE_MAXSIZE:
+            del _metadata_cache[next(iter(_metadata_cache))]
+
+def clear_metadata_cache(schema: Optional[str] = None, table_name: Optional[str] = None) -> int:
+    """清除元数据缓存
+
+    Args:
+        schema: 架构名，为空时清除全部缓存
+        table_name: 表名，指定时只清除该表的结构缓存和所在架构的结构快照
+
+    Returns:
+        被清除的缓存条目数量
+    """
+    with _metadata_cache_lock:
+        if schema is None and table_name is None:
+            keys = list(_metadata_cache)
+        elif table_name is not None:
+            # 架构快照中也包含该表的结构，一并清除
+            keys = [("table", schema or "dbo", table_name), ("snapshot", schema or "dbo")]
+        else:
+            keys = [key for key in _metadata_cache if len(key) > 1 and key[1] == schema]
+        # 架构名集合总是一并清除，新建架构后按架构刷新即可通过架构校验
+        if ("schemas",) not in keys:
+            keys.append(("schemas",))
+        cleared = 0
+        for key in keys:
+            if _metadata_cache.pop(key, None) is not None:
+                cleared += 1
+    logger.info("已清除 %d 条元数据缓存", cleared)
+    return cleared
 
 def get_db_connection():
     """获取数据库连接，如果不存在则创建新连接"""
     global engine
+    # 双重检查加锁：初始化完成后直接返回，不再竞争锁；
+    # 并发的首次调用只有一个线程创建引擎，其余线程等待后复用
     if engine is None:
-        try:
-            print("正在创建数据库连接...")
-            print(f"连接到: {config.DB_HOST}:{config.DB_PORT}, 数据库: {config.DB_NAME}, 用户: {config.DB_USER}")
-            print(f"连接字符串: {config.CONNECTION_STRING}")
-            
-            # 创建引擎时设置连接池选项
-            engine = create_engine(
-                config.CONNECTION_STRING,
-                pool_pre_ping=True,  # 检查连接是否有效
-                pool_recycle=3600,   # 每小时回收连接
-                connect_args={
-                    'timeout': 30     # 连接超时时间（秒）
-                }
-            )
-            
-            # 测试连接
-            with engine.connect() as conn:
-                result = conn.execute(text("SELECT 1")).fetchone()
-                print(f"测试连接结果: {result}")
-                
-            print("数据库连接创建成功")
-        except SQLAlchemyError as e:
-            error_msg = f"数据库连接失败: {str(e)}"
-            print(error_msg)
-            
-            # 尝试获取更详细的错误信息
-            if hasattr(e, 'orig') and e.orig:
-                print(f"原始错误: {e.orig}")
-                if hasattr(e.orig, 'args') and e.orig.args:
-                    print(f"错误参数: {e.orig.args}")
-            
-            raise Exception(error_msg)
+        with _engine_lock:
+            if engine is None:
+                engine = _create_db_engine()
     return engine
 
-def execute_query(sql: str) -> Dict[str, Any]:
+def _create_db_engine():
+    """创建数据库引擎并测试连接，测试通过后才返回"""
+    try:
+        logger.info("正在创建数据库连接...")
+        logger.info("连接到: %s:%s, 数据库: %s, 用户: %s", config.DB_HOST, config.DB_PORT, config.DB_NAME, config.DB_USER)
+        
+        # 创建引擎时设置连接池选项
+        new_engine = create_engine(
+            config.CONNECTION_STRING,
+            pool_size=config.DB_POOL_SIZE,        # 常驻连接数，支撑并发的工具调用
+            max_overflow=config.DB_MAX_OVERFLOW,  # 高峰时允许额外创建的连接数
+            pool_pre_ping=True,  # 检查连接是否有效
+            pool_recycle=config.DB_POOL_RECYCLE,  # 定期回收连接，避免被服务端或网络设备断开的空闲连接
+            pool_reset_on_return='rollback',  # 归还连接时回滚，结束未提交的只读事务
+            connect_args={
+                'timeout': 30     # 连接超时时间（秒）
+            }
+        )
+        
+        # 测试连接
+        with new_engine.connect() as conn:
+            result = conn.execute(_PING_SQL).fetchone()
+            logger.debug("测试连接结果: %s", result)
+            
+        logger.info("数据库连接创建成功")
+        return new_engine
+    except SQLAlchemyError as e:
+        error_msg = f"数据库连接失败: {str(e)}"
+        logger.error(error_msg)
+        
+        # 尝试获取更详细的错误信息
+        if hasattr(e, 'orig') and e.orig:
+            logger.error("原始错误: %s", e.orig)
+            if hasattr(e.orig, 'args') and e.orig.args:
+                logger.error("错误参数: %s", e.orig.args)
+        
+        raise Exception(error_msg)
+
+def warm_up_connection_pool() -> int:
+    """预热连接池：并行建立DB_POOL_SIZE个连接并归还到池中，
+    让首次工具调用不必承担建立连接、认证的开销
+    
+    Returns:
+        成功预热的连接数量
+    """
+    engine = get_db_connection()
+
+    def open_connection():
+        conn = engine.connect()
+        try:
+            conn.execute(_PING_SQL)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    # 所有连接建立完成后才统一归还，保证每个线程拿到的是不同的连接
+    with ThreadPoolExecutor(max_workers=config.DB_POOL_SIZE) as executor:
+        futures = [executor.submit(open_connection) for _ in range(config.DB_POOL_SIZE)]
+    connections = []
+    for future in futures:
+        try:
+            connections.append(future.result())
+        except Exception as e:
+            logger.warning("预热连接失败: %s", e)
+    for conn in connections:
+        conn.close()
+    logger.info("连接池预热完成，已建立 %d 个连接", len(connections))
+    return len(connections)
+
+def _raw_connection():
+    """从连接池中取出底层pyodbc连接，用于固定的元数据查询
+    
+    元数据查询的SQL是固定的，直接使用pyodbc游标可以省去SQLAlchemy的语句编译和Row封装，
+    连接仍然来自同一个连接池，关闭时归还到池中
+    """
+    return closing(get_db_connection().raw_connection())
+
+def _fetch_result_sets(conn, batch_sql: str, params: Sequence[Any] = ()) -> List[List[Dict[str, Any]]]:
+    """通过pyodbc游标执行多语句批处理，一次往返取回全部结果集
+    
+    Args:
+        conn: 底层pyodbc连接（见_raw_connection）
+        batch_sql: 多条语句组成的批处理SQL，参数占位符为 ?
+        params: 按顺序绑定的参数
+        
+    Returns:
+        每个结果集对应一个行字典列表
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(batch_sql, *params)
+        result_sets = []
+        while True:
+            # 没有description的是不返回行的语句（如SET），跳过
+            if cursor.description is not None:
+                col_names = [col[0] for col in cursor.description]
+                result_sets.append([dict(zip(col_names, row)) for row in cursor.fetchall()])
+            if not cursor.nextset():
+                break
+        return result_sets
+    finally:
+        cursor.close()
+
+# 查询所有架构名，用于校验调用方传入的架构
+_SCHEMA_NAMES_SQL = "SELECT name AS schema_name FROM sys.schemas WITH (NOLOCK)"
+
+def _check_schema_exists(schema: str) -> Optional[str]:
+    """校验架构是否存在，存在时返回None，否则返回错误信息
+    
+    架构名集合缓存TABLE_LIST_CACHE_TTL秒，命中缓存时不需要访问数据库；
+    比较时忽略大小写，与SQL Server默认排序规则一致
+    """
+    cache_key = ("schemas",)
+    known = _cache_get(cache_key, config.TABLE_LIST_CACHE_TTL)
+    if known is None:
+        with _raw_connection() as conn:
+            rows = _fetch_result_sets(conn, _SCHEMA_NAMES_SQL)[0]
+        known = {"names": frozenset(row["schema_name"].casefold() for row in rows)}
+        _cache_set(cache_key, known)
+    if schema.casefold() not in known["names"]:
+        return f"架构不存在: {schema}"
+    return None
+
+# 只读查询允许的顶层语句类型
+_READ_ONLY_STATEMENTS = (exp.Select, exp.Union, exp.Intersect, exp.Except)
+
+# 查询中任何位置都不允许出现的操作（不同sqlglot版本中类名略有差异）
+_FORBIDDEN_EXPRESSIONS = tuple(
+    getattr(exp, name)
+    for name in ("Into", "Insert", "Update", "Delete", "Merge", "Drop", "Create",
+                 "Alter", "AlterTable", "TruncateTable", "Command", "Execute")
+    if hasattr(exp, name)
+)
+
+# T-SQL中语句之间可以不用分号分隔，sqlglot会把 "SELECT 1 DELETE FROM t" 中的DELETE解析为列别名，
+# 而SQL Server会把它当作两条语句执行；因此在语法树检查之外，还要求未加引号的词（关键字或标识符）
+# 都不是写操作、DDL或服务器控制语句的关键字，OPENQUERY等会把远程语句原样传给链接服务器，同样禁止
+_FORBIDDEN_KEYWORDS = frozenset({
+    "DELETE", "INSERT", "UPDATE", "MERGE", "DROP", "CREATE", "ALTER", "TRUNCATE",
+    "EXEC", "EXECUTE", "SHUTDOWN", "KILL", "BACKUP", "RESTORE", "GRANT", "DENY", "REVOKE",
+    "CHECKPOINT", "DBCC", "OPENQUERY", "OPENROWSET", "OPENDATASOURCE",
+})
+
+# 加引号的标识符和字符串常量，其内容不参与关键字检查
+_QUOTED_TOKEN_TYPES = frozenset(
+    getattr(TokenType, name)
+    for name in ("IDENTIFIER", "STRING", "NATIONAL_STRING", "UNICODE_STRING", "RAW_STRING",
+                 "HEREDOC_STRING", "BIT_STRING", "HEX_STRING", "BYTE_STRING")
+    if hasattr(TokenType, name)
+)
+
+# 语句末尾的分号（及其后的注释）会被解析为单独的空语句
+_EMPTY_STATEMENTS = tuple(getattr(exp, name) for name in ("Semicolon",) if hasattr(exp, name))
+
+def _check_read_only_sql(sql: str) -> Optional[str]:
+    """用sqlglot解析SQL，确认是单条只读查询，合法时返回None，否则返回错误信息"""
+    try:
+        tokens = sqlglot.Dialect.get_or_raise("tsql").tokenize(sql)
+        statements = [
+            statement for statement in sqlglot.parse(sql, dialect="tsql")
+            if statement is not None and not isinstance(statement, _EMPTY_STATEMENTS)
+        ]
+    except SqlglotError as e:
+        # 包括解析错误（ParseError）和分词错误（TokenError，如未闭合的字符串）
+        return f"安全限制：SQL解析失败: {e}"
+    for token in tokens:
+        if token.token_type not in _QUOTED_TOKEN_TYPES and token.text.upper() in _FORBIDDEN_KEYWORDS:
+            return f"安全限制：查询中包含禁止的操作 '{token.text.upper()}'"
+    if len(statements) != 1:
+        return "安全限制：只允许执行单条SELECT语句"
+    statement = statements[0]
+    if not isinstance(statement, _READ_ONLY_STATEMENTS):
+        return "安全限制：只允许执行SELECT语句"
+    forbidden = statement.find(*_FORBIDDEN_EXPRESSIONS)
+    if forbidden is not None:
+        return f"安全限制：查询中包含禁止的操作 '{forbidden.key.upper()}'"
+    return None
+
+# 不能原样放入JSON结果的值类型及其转换方式，其余类型（int、float、str、bool、None）原样返回
+_VALUE_CONVERTERS = {
+    bytes: lambda value: "0x" + value.hex().upper(),
+    bytearray: lambda value: "0x" + value.hex().upper(),
+    Decimal: str,
+    uuid.UUID: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+}
+
+def _coerce(value: Any) -> Any:
+    """将查询结果中的单个值转换为JSON友好的原生类型"""
+    converter = _VALUE_CONVERTERS.get(type(value))
+    return value if converter is None else converter(value)
+
+# 用户查询放在sp_executesql中执行，前置的SET选项只在本次执行内生效，
+# 不会残留在连接池的连接上，且与查询一起发送，不增加网络往返
+_GUARDED_QUERY_SQL = "EXEC sp_executesql ?, N'@max_rows INT', @max_rows = ?"
+
+def _build_guarded_query(sql: str, read_uncommitted: bool = False) -> str:
+    """在用户查询前加上锁等待超时和行数上限等保护性SET语句"""
+    guards = [
+        "SET NOCOUNT ON",
+        f"SET LOCK_TIMEOUT {int(config.QUERY_LOCK_TIMEOUT_MS)}",
+        # 服务端最多产生@max_rows行，避免大结果集在服务端物化后再被客户端丢弃
+        "SET ROWCOUNT @max_rows"
+    ]
+    if read_uncommitted:
+        # 等同于对查询中的所有表使用WITH (NOLOCK)
+        guards.append("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
+    return ";\n".join(guards + [sql])
+
+# max_rows + 1 绑定到 @max_rows INT，需保证不超出INT范围
+_MAX_ROWS_BOUND = 2 ** 31 - 2
+
+def execute_query(sql: str, max_rows: Optional[int] = None, read_uncommitted: bool = False) -> Dict[str, Any]:
     """执行SQL查询并返回结果集
     
     Args:
         sql: SQL查询语句（必须是SELECT语句）
+        max_rows: 最多返回的行数，默认取配置项QUERY_MAX_ROWS，不能超过QUERY_MAX_ROWS_LIMIT
+        read_uncommitted: 是否以READ UNCOMMITTED隔离级别执行（不等待行锁，可能读到未提交数据）
         
     Returns:
         包含查询结果的字典
     """
+    if max_rows is None:
+        max_rows = config.QUERY_MAX_ROWS
+    if max_rows <= 0:
+        return {
+            "error": f"max_rows必须大于0: {max_rows}",
+            "sql": sql
+        }
+    max_rows_limit = min(config.QUERY_MAX_ROWS_LIMIT, _MAX_ROWS_BOUND)
+    if max_rows > max_rows_limit:
+        return {
+            "error": f"max_rows不能超过{max_rows_limit}: {max_rows}",
+            "sql": sql
+        }
+
     try:
-        print(f"执行SQL查询: {sql[:100]}{'...' if len(sql) > 100 else ''}")
+        logger.debug("执行SQL查询: %.100s", sql)
         # 安全检查：确保只执行SELECT语句
-        sql_lower = sql.lower().strip()
-        if not sql_lower.startswith("select"):
-            error_msg = "安全限制：只允许执行SELECT语句"
-            print(f"{error_msg}, SQL: {sql}")
+        error_msg = _check_read_only_sql(sql)
+        if error_msg:
+            logger.warning("%s, SQL: %s", error_msg, sql)
             return {
                 "error": error_msg,
                 "sql": sql
             }
-            
-        # 检查是否包含危险操作
-        dangerous_keywords = ["insert", "update", "delete", "drop", "alter", "create", "truncate", "exec", "execute"]
-        for keyword in dangerous_keywords:
-            if f" {keyword} " in f" {sql_lower} ":
-                error_msg = f"安全限制：查询中包含禁止的关键字 '{keyword}'"
-                print(f"{error_msg}, SQL: {sql}")
-                return {
-                    "error": error_msg,
-                    "sql": sql
-                }
         
         engine = get_db_connection()
         
         with engine.connect() as conn:
-            result = conn.execute(text(sql))
+            # 多取一行用于判断结果是否被截断
+            result = conn.exec_driver_sql(
+                _GUARDED_QUERY_SQL, (_build_guarded_query(sql, read_uncommitted), max_rows + 1)
+            )
             # 获取列名
             columns = list(result.keys())
             
-            # 转换结果为字典列表
-            result_rows = []
-            for row in result:
-                try:
-                    # 尝试使用字典推导式创建字典
-                    row_dict = {col: row[i] for i, col in enumerate(columns)}
-                    result_rows.append(row_dict)
-                except Exception as row_err:
-                    print(f"处理行数据时出错: {row_err}")
-                    # 如果出错，尝试使用其他方式
-                    try:
-                        # 尝试直接将行转换为字典
-                        row_dict = {}
-                        for i, col in enumerate(columns):
-                            try:
-                                row_dict[col] = row[i]
-                            except:
-                                row_dict[col] = None
-                        result_rows.append(row_dict)
-                    except Exception as e:
-                        print(f"处理行数据的备选方法也失败: {e}")
-                        # 最后的备选方案，只添加原始值
-                        result_rows.append({"value": str(row)})
+            # 游标按需从网络读取行，只取max_rows行
+            mappings = result.mappings()
+            result_rows = [
+                {col: _coerce(value) for col, value in row.items()}
+                for row in mappings.fetchmany(max_rows)
+            ]
+            truncated = mappings.fetchone() is not None
+            result.close()
         
-        print(f"查询成功，返回 {len(result_rows)} 条记录")
+        logger.info("查询成功，返回 %d 条记录%s", len(result_rows), "（结果已截断）" if truncated else "")
         return {
             "columns": columns,
             "rows": result_rows,
-            "row_count": len(result_rows)
+            "row_count": len(result_rows),
+            "truncated": truncated
         }
     except Exception as e:
-        error_msg = f"查询执行失败: {str(e)}"
-        print(f"{error_msg}, SQL: {sql}")
+        logger.error("查询执行失败: %s, SQL: %s", e, sql)
         return {
             "error": str(e),
             "sql": sql
         }
 
+# 结构查询先把目标表解析到表变量 @tables 中，以下四个查询都与 @tables 关联，
+# 避免每个查询重复连接 sys.tables 和 sys.schemas；每个查询都返回 table_name 列并按表名排序，便于按表分组
+#
+# 本模块中的元数据查询对系统目录视图统一使用 WITH (NOLOCK)，不会因并发DDL持有的锁而等待；
+# 使用表提示而不是 SET TRANSACTION ISOLATION LEVEL，隔离级别不会残留在连接池的连接上
+
+# 查询列信息
+_COLUMNS_SQL = """
+    SELECT 
+        t.table_name,
+        c.name AS column_name,
+        ty.name AS data_type,
+        c.max_length,
+        c.precision,
+        c.scale,
+        c.is_nullable,
+        CAST(ISNULL(CAST(ep.value AS NVARCHAR(MAX)), '') AS NVARCHAR(MAX)) AS description
+    FROM 
+        @tables t
+    JOIN 
+        sys.columns c WITH (NOLOCK) ON c.object_id = t.object_id
+    JOIN 
+        sys.types ty WITH (NOLOCK) ON c.user_type_id = ty.user_type_id
+    LEFT JOIN 
+        sys.extended_properties ep WITH (NOLOCK) ON c.object_id = ep.major_id AND c.column_id = ep.minor_id AND ep.name = 'MS_Description'
+    ORDER BY 
+        t.table_name, c.column_id
+"""
+
+# 查询主键信息
+_PRIMARY_KEYS_SQL = """
+    SELECT 
+        t.table_name,
+        c.name AS column_name
+    FROM 
+        @tables t
+    JOIN 
+        sys.indexes i WITH (NOLOCK) ON i.object_id = t.object_id
+    JOIN 
+        sys.index_columns ic WITH (NOLOCK) ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+    JOIN 
+        sys.columns c WITH (NOLOCK) ON ic.object_id = c.object_id AND ic.column_id = c.column_id
+    WHERE 
+        i.is_primary_key = 1
+    ORDER BY 
+        t.table_name, ic.key_ordinal
+"""
+
+# 查询外键信息
+_FOREIGN_KEYS_SQL = """
+    SELECT 
+        t.table_name,
+        fk.name AS fk_name,
+        COL_NAME(fc.parent_object_id, fc.parent_column_id) AS column_name,
+        OBJECT_NAME(fc.referenced_object_id) AS referenced_table,
+        COL_NAME(fc.referenced_object_id, fc.referenced_column_id) AS referenced_column
+    FROM 
+        @tables t
+    JOIN 
+        sys.foreign_keys fk WITH (NOLOCK) ON fk.parent_object_id = t.object_id
+    JOIN 
+        sys.foreign_key_columns fc WITH (NOLOCK) ON fk.object_id = fc.constraint_object_id
+    ORDER BY 
+        t.table_name, fk.name, fc.constraint_column_id
+"""
+
+# 查询索引信息，每个索引列一行，由Python按索引分组
+_INDEXES_SQL = """
+    SELECT
+        t.table_name,
+        i.index_id,
+        i.name AS index_name,
+        i.type_desc AS index_type,
+        i.is_unique,
+        i.is_primary_key,
+        i.is_unique_constraint,
+        c.name AS column_name
+    FROM
+        @tables t
+    JOIN
+        sys.indexes i WITH (NOLOCK) ON i.object_id = t.object_id
+    LEFT JOIN
+        sys.index_columns ic WITH (NOLOCK) ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+    LEFT JOIN
+        sys.columns c WITH (NOLOCK) ON ic.object_id = c.object_id AND ic.column_id = c.column_id
+    ORDER BY
+        t.table_name, i.name, i.index_id, ic.is_included_column, ic.key_ordinal, ic.index_column_id
+"""
+
+def _build_structure_sql(declare_sql: str, table_filter: str) -> str:
+    """将目标表解析和四个查询合并为一个批处理，一次往返返回四个结果集"""
+    return ";\n".join([
+        "SET NOCOUNT ON",
+        declare_sql,
+        "DECLARE @tables TABLE (object_id INT PRIMARY KEY, table_name SYSNAME)",
+        f"INSERT INTO @tables (object_id, table_name) SELECT t.object_id, t.name FROM sys.tables t WITH (NOLOCK) WHERE {table_filter}",
+        _COLUMNS_SQL,
+        _PRIMARY_KEYS_SQL,
+        _FOREIGN_KEYS_SQL,
+        _INDEXES_SQL
+    ])
+
+# 单表结构查询，表名和架构名通过参数绑定
+_TABLE_STRUCTURE_SQL = _build_structure_sql(
+    "DECLARE @table_name SYSNAME = ?, @schema SYSNAME = ?",
+    "t.schema_id = SCHEMA_ID(@schema) AND t.name = @table_name"
+)
+
+# 整个架构的结构查询，架构名通过参数绑定
+_SCHEMA_SNAPSHOT_SQL = _build_structure_sql(
+    "DECLARE @schema SYSNAME = ?",
+    "t.schema_id = SCHEMA_ID(@schema)"
+)
+
+def _build_table_structures(columns_rows, primary_keys_rows, foreign_keys_rows, indexes_rows) -> Dict[str, Dict[str, Any]]:
+    """将结构查询的四个结果集按表名分组，组装为表结构字典"""
+    structures: Dict[str, Dict[str, Any]] = {}
+
+    def table_entry(table_name: str) -> Dict[str, Any]:
+        return structures.setdefault(table_name, {
+            "columns": [],
+            "primary_keys": [],
+            "foreign_keys": [],
+            "indexes": []
+        })
+
+    # 处理列信息
+    for row in columns_rows:
+        table_entry(row["table_name"])["columns"].append({
+            "name": row["column_name"],
+            "type": row["data_type"],
+            "max_length": row["max_length"],
+            "precision": row["precision"],
+            "scale": row["scale"],
+            "is_nullable": bool(row["is_nullable"]),
+            "description": row["description"]
+        })
+
+    # 处理主键信息
+    for row in primary_keys_rows:
+        table_entry(row["table_name"])["primary_keys"].append(row["column_name"])
+
+    # 处理外键信息
+    for row in foreign_keys_rows:
+        table_entry(row["table_name"])["foreign_keys"].append({
+            "name": row["fk_name"],
+            "column": row["column_name"],
+            "referenced_table": row["referenced_table"],
+            "referenced_column": row["referenced_column"]
+        })
+
+    # 处理索引信息
+    for (table_name, _), index_rows in groupby(indexes_rows, key=itemgetter("table_name", "index_id")):
+        index_rows = list(index_rows)
+        row = index_rows[0]
+        table_entry(table_name)["indexes"].append({
+            "name": row["index_name"],
+            "type": row["index_type"],
+            "is_unique": bool(row["is_unique"]),
+            "is_primary_key": bool(row["is_primary_key"]),
+            "is_unique_constraint": bool(row["is_unique_constraint"]),
+            "columns": [r["column_name"] for r in index_rows if r["column_name"] is not None]
+        })
+
+    return structures
+
 def get_table_info(table_name: str, schema: str = "dbo") -> Dict[str, Any]:
     """获取指定表的结构信息
     
@@ -138,174 +569,128 @@ def get_table_info(table_name: str, schema: str = "dbo") -> Dict[str, Any]:
     Returns:
         包含表结构信息的字典
     """
+    error_msg = _validate_identifier(table_name, "表名") or _validate_identifier(schema, "架构名")
+    if error_msg:
+        logger.warning(error_msg)
+        return {
+            "error": error_msg
+        }
+
+    cache_key = ("table", schema, table_name)
+    cached = _cache_get(cache_key, config.METADATA_CACHE_TTL)
+    if cached is not None:
+        return cached
+
     try:
-        print(f"获取表结构信息: {schema}.{table_name}")
-        engine = get_db_connection()
-        
-        # 查询列信息
-        columns_sql = f"""
-        SELECT 
-            c.name AS column_name,
-            t.name AS data_type,
-            c.max_length,
-            c.precision,
-            c.scale,
-            c.is_nullable,
-            CAST(ISNULL(CAST(ep.value AS NVARCHAR(MAX)), '') AS NVARCHAR(MAX)) AS description
-        FROM 
-            sys.columns c
-        JOIN 
-            sys.types t ON c.user_type_id = t.user_type_id
-        JOIN 
-            sys.tables tb ON c.object_id = tb.object_id
-        JOIN 
-            sys.schemas s ON tb.schema_id = s.schema_id
-        LEFT JOIN 
-            sys.extended_properties ep ON c.object_id = ep.major_id AND c.column_id = ep.minor_id AND ep.name = 'MS_Description'
-        WHERE 
-            tb.name = '{table_name}' AND s.name = '{schema}'
-        ORDER BY 
-            c.column_id
-        """
-
-        # 查询主键信息
-        primary_keys_sql = f"""
-        SELECT 
-            c.name AS column_name
-        FROM 
-            sys.indexes i
-        JOIN 
-            sys.index_columns ic ON i.object_id = ic.object_id AND i.index_id = ic.index_id
-        JOIN 
-            sys.columns c ON ic.object_id = c.object_id AND ic.column_id = c.column_id
-        JOIN 
-            sys.tables t ON i.object_id = t.object_id
-        JOIN 
-            sys.schemas s ON t.schema_id = s.schema_id
-        WHERE 
-            i.is_primary_key = 1 AND t.name = '{table_name}' AND s.name = '{schema}'
-        ORDER BY 
-            ic.key_ordinal
-        """
-
-        # 查询外键信息
-        foreign_keys_sql = f"""
-        SELECT 
-            fk.name AS fk_name,
-            COL_NAME(fc.parent_object_id, fc.parent_column_id) AS column_name,
-            OBJECT_NAME(fc.referenced_object_id) AS referenced_table,
-            COL_NAME(fc.referenced_object_id, fc.referenced_column_id) AS referenced_column
-        FROM 
-            sys.foreign_keys fk
-        JOIN 
-            sys.foreign_key_columns fc ON fk.object_id = fc.constraint_object_id
-        JOIN 
-            sys.tables t ON fk.parent_object_id = t.object_id
-        JOIN 
-            sys.schemas s ON t.schema_id = s.schema_id
-        WHERE 
-            t.name = '{table_name}' AND s.name = '{schema}'
-        ORDER BY 
-            fk.name, fc.constraint_column_id
-        """
-
-        # 查询索引信息
-        indexes_sql = f"""
-        SELECT
-            i.name AS index_name,
-            i.type_desc AS index_type,
-            i.is_unique,
-            i.is_primary_key,
-            i.is_unique_constraint,
-            STUFF((
-                SELECT ', ' + c2.name
-                FROM sys.index_columns ic2
-                JOIN sys.columns c2 ON ic2.object_id = c2.object_id AND ic2.column_id = c2.column_id
-                WHERE ic2.object_id = i.object_id AND ic2.index_id = i.index_id
-                ORDER BY ic2.key_ordinal
-                FOR XML PATH(''), TYPE
-            ).value('.', 'NVARCHAR(MAX)'), 1, 2, '') AS columns
-        FROM
-            sys.indexes i
-        JOIN
-            sys.tables t ON i.object_id = t.object_id
-        JOIN
-            sys.schemas s ON t.schema_id = s.schema_id
-        WHERE
-            t.name = '{table_name}' AND s.name = '{schema}'
-        GROUP BY
-            i.object_id, i.index_id, i.name, i.type_desc, i.is_unique, i.is_primary_key, i.is_unique_constraint
-        ORDER BY
-            i.name
-        """
-
-        # Execute and process columns_sql
-        columns = []
-        with engine.connect() as conn:
-            columns_result = conn.execute(text(columns_sql))
-            # 处理列信息
-            for row in columns_result:
-                column = {
-                    "name": row.column_name,
-                    "type": row.data_type,
-                    "max_length": row.max_length,
-                    "precision": row.precision,
-                    "scale": row.scale,
-                    "is_nullable": bool(row.is_nullable),
-                    "description": row.description
-                }
-                columns.append(column)
-
-        # Execute and process primary_keys_sql
-        primary_keys = []
-        with engine.connect() as conn:
-            primary_keys_result = conn.execute(text(primary_keys_sql))
-            # 处理主键信息
-            primary_keys = [row.column_name for row in primary_keys_result]
+        logger.info("获取表结构信息: %s.%s", schema, table_name)
+        error_msg = _check_schema_exists(schema)
+        if error_msg:
+            logger.warning(error_msg)
+            return {
+                "error": error_msg
+            }
 
-        # Execute and process foreign_keys_sql
-        foreign_keys = []
-        with engine.connect() as conn:
-            foreign_keys_result = conn.execute(text(foreign_keys_sql))
-            # 处理外键信息
-            for row in foreign_keys_result:
-                fk = {
-                    "name": row.fk_name,
-                    "column": row.column_name,
-                    "referenced_table": row.referenced_table,
-                    "referenced_column": row.referenced_column
-                }
-                foreign_keys.append(fk)
-
-        # Execute and process indexes_sql
-        indexes = []
-        with engine.connect() as conn:
-            indexes_result = conn.execute(text(indexes_sql))
-            # 处理索引信息
-            for row in indexes_result:
-                index = {
-                    "name": row.index_name,
-                    "type": row.index_type,
-                    "is_unique": bool(row.is_unique),
-                    "is_primary_key": bool(row.is_primary_key),
-                    "is_unique_constraint": bool(row.is_unique_constraint),
-                    "columns": row.columns.split(", ") if row.columns else []
-                }
-                indexes.append(index)
+        with _raw_connection() as conn:
+            result_sets = _fetch_result_sets(conn, _TABLE_STRUCTURE_SQL, (table_name, schema))
 
+        # 表名比较遵循数据库排序规则（可能不区分大小写），因此直接取唯一的一组结果
+        structures = _build_table_structures(*result_sets)
+        table_info = next(iter(structures.values()), {
+            "columns": [],
+            "primary_keys": [],
+            "foreign_keys": [],
+            "indexes": []
+        })
+        _cache_set(cache_key, table_info)
+        return table_info
+    except Exception as e:
+        logger.error("获取表结构失败: %s", e)
         return {
-            "columns": columns,
-            "primary_keys": primary_keys,
-            "foreign_keys": foreign_keys,
-            "indexes": indexes
+            "error": str(e)
         }
+
+def get_schema_snapshot_info(schema: str = "dbo") -> Dict[str, Any]:
+    """一次性获取架构中所有表的结构信息
+    
+    Args:
+        schema: 架构名，默认为dbo
+        
+    Returns:
+        包含架构中所有表结构信息的字典
+    """
+    error_msg = _validate_identifier(schema, "架构名")
+    if error_msg:
+        logger.warning(error_msg)
+        return {
+            "error": error_msg,
+            "schema": schema
+        }
+
+    cache_key = ("snapshot", schema)
+    cached = _cache_get(cache_key, config.METADATA_CACHE_TTL)
+    if cached is not None:
+        return cached
+
+    try:
+        logger.info("获取架构 '%s' 的结构快照", schema)
+        error_msg = _check_schema_exists(schema)
+        if error_msg:
+            logger.warning(error_msg)
+            return {
+                "error": error_msg,
+                "schema": schema
+            }
+
+        with _raw_connection() as conn:
+            result_sets = _fetch_result_sets(conn, _SCHEMA_SNAPSHOT_SQL, (schema,))
+
+        tables = _build_table_structures(*result_sets)
+        logger.info("成功获取 %d 个表的结构", len(tables))
+        snapshot = {
+            "schema": schema,
+            "tables": tables,
+            "count": len(tables)
+        }
+        _cache_set(cache_key, snapshot)
+        return snapshot
     except Exception as e:
-        error_msg = f"获取表结构失败: {str(e)}"
-        print(error_msg)
+        logger.error("获取架构结构快照失败: %s, 架构: %s", e, schema)
         return {
-            "error": str(e)
+            "error": str(e),
+            "schema": schema
         }
 
+# 表描述通过OUTER APPLY取第一条MS_Description，没有描述时返回空字符串，
+# 结果固定为三列，不再需要探测和回退到不带描述的查询
+_LIST_TABLES_SQL = """
+    SELECT
+        t.name AS table_name,
+        COALESCE(ep.description, N'') AS description,
+        s.name AS schema_name
+    FROM
+        sys.tables t WITH (NOLOCK)
+    JOIN
+        sys.schemas s WITH (NOLOCK) ON t.schema_id = s.schema_id
+    OUTER APPLY (
+        SELECT TOP (1) CAST(p.value AS NVARCHAR(MAX)) AS description
+        FROM sys.extended_properties p WITH (NOLOCK)
+        WHERE p.class = 1 AND p.major_id = t.object_id AND p.minor_id = 0 AND p.name = 'MS_Description'
+    ) ep
+    WHERE
+        s.name = ?
+    ORDER BY
+        t.name
+"""
+
+def _query_tables(conn, schema: str) -> Dict[str, Any]:
+    """查询架构中的表列表（不经过缓存）"""
+    tables = _fetch_result_sets(conn, _LIST_TABLES_SQL, (schema,))[0]
+    logger.info("成功获取 %d 个表", len(tables))
+    return {
+        "tables": tables,
+        "count": len(tables)
+    }
+
 def list_show_tables(schema: str = "dbo") -> Dict[str, Any]:
     """列出数据库中的所有表
     
@@ -315,139 +700,140 @@ def list_show_tables(schema: str = "dbo") -> Dict[str, Any]:
     Returns:
         包含表列表的字典
     """
+    error_msg = _validate_identifier(schema, "架构名")
+    if error_msg:
+        logger.warning(error_msg)
+        return {
+            "error": error_msg,
+            "schema": schema
+        }
+
+    cache_key = ("tables", schema)
+    cached = _cache_get(cache_key, config.TABLE_LIST_CACHE_TTL)
+    if cached is not None:
+        return cached
+
     try:
-        print(f"列出架构 '{schema}' 中的所有表")
-        engine = get_db_connection()
-        
-        # 修改SQL查询，避免使用可能导致类型不兼容的字段
-        # 使用CAST将可能有问题的字段转换为兼容的类型
-        sql = f"""
-        SELECT
-            t.name AS table_name,
-            CAST(ISNULL(CAST(ep.value AS NVARCHAR(MAX)), '') AS NVARCHAR(MAX)) AS description,
-            s.name AS schema_name
-        FROM
-            sys.tables t
-        JOIN
-            sys.schemas s ON t.schema_id = s.schema_id
-        LEFT JOIN
-            sys.extended_properties ep ON t.object_id = ep.major_id AND ep.minor_id = 0 AND ep.name = 'MS_Description'
-        WHERE
-            s.name = '{schema}'
-        ORDER BY
-            t.name
-        """
-        
-        # 如果上面的查询仍然不起作用，尝试使用更简单的查询
-        simple_sql = f"""
-        SELECT
-            t.name AS table_name,
-            s.name AS schema_name
-        FROM
-            sys.tables t
-        JOIN
-            sys.schemas s ON t.schema_id = s.schema_id
-        WHERE
-            s.name = '{schema}'
-        ORDER BY
-            t.name
-        """
-        
-        try:
-            with engine.connect() as conn:
-                print("尝试执行带有表描述的查询...")
-                result = conn.execute(text(sql))
-                col_names = list(result.keys())
-                tables = []
-                for row in result:
-                    try:
-                        # 安全地将行转换为字典
-                        row_dict = {}
-                        for i, col in enumerate(col_names):
-                            try:
-                                # 尝试将每个值转换为字符串，避免类型问题
-                                value = row[i]
-                                if value is not None:
-                                    row_dict[col] = str(value)
-                                else:
-                                    row_dict[col] = ""
-                            except Exception as val_err:
-                                print(f"处理列 {col} 的值时出错: {val_err}")
-                                row_dict[col] = ""
-                        tables.append(row_dict)
-                    except Exception as e:
-                        print(f"处理表信息时出错: {e}")
-                        tables.append({"table_name": str(row[0]) if row and len(row) > 0 else "unknown"})
-        except Exception as complex_query_error:
-            print(f"复杂查询失败，尝试简单查询: {complex_query_error}")
-            # 如果复杂查询失败，尝试简单查询
-            with engine.connect() as conn:
-                print("执行简化的表查询...")
-                result = conn.execute(text(simple_sql))
-                col_names = list(result.keys())
-                tables = []
-                for row in result:
-                    try:
-                        row_dict = {}
-                        for i, col in enumerate(col_names):
-                            try:
-                                value = row[i]
-                                row_dict[col] = str(value) if value is not None else ""
-                            except:
-                                row_dict[col] = ""
-                        # 添加空的描述字段
-                        if "description" not in row_dict:
-                            row_dict["description"] = ""
-                        tables.append(row_dict)
-                    except Exception as e:
-                        print(f"处理简化表信息时出错: {e}")
-                        tables.append({"table_name": str(row[0]) if row and len(row) > 0 else "unknown"})
+        logger.info("列出架构 '%s' 中的所有表", schema)
+        error_msg = _check_schema_exists(schema)
+        if error_msg:
+            logger.warning(error_msg)
+            return {
+                "error": error_msg,
+                "schema": schema
+            }
+
+        with _raw_connection() as conn:
+            tables_info = _query_tables(conn, schema)
+        _cache_set(cache_key, tables_info)
+        return tables_info
+    except Exception as e:
+        logger.error("列出表失败: %s, 架构: %s", e, schema)
+        return {
+            "error": str(e),
+            "schema": schema
+        }
+
+# 表列表的版本标识：表数量加上每张表的object_id、修改时间和表描述的校验和，
+# 建表、删表、改表以及修改表描述（sp_updateextendedproperty不会更新modify_date）都会使其变化；
+# 使用BINARY_CHECKSUM使只改变大小写的描述也能被识别
+_TABLES_VERSION_SQL = """
+    SELECT
+        COUNT(*) AS table_count,
+        CHECKSUM_AGG(BINARY_CHECKSUM(t.object_id, t.modify_date, ep.description)) AS tables_checksum
+    FROM
+        sys.tables t WITH (NOLOCK)
+    JOIN
+        sys.schemas s WITH (NOLOCK) ON t.schema_id = s.schema_id
+    OUTER APPLY (
+        SELECT TOP (1) CAST(p.value AS NVARCHAR(MAX)) AS description
+        FROM sys.extended_properties p WITH (NOLOCK)
+        WHERE p.class = 1 AND p.major_id = t.object_id AND p.minor_id = 0 AND p.name = 'MS_Description'
+    ) ep
+    WHERE
+        s.name = ?
+"""
+
+def get_tables_with_etag(schema: str = "dbo") -> Dict[str, Any]:
+    """列出数据库中的所有表，并附带表列表的版本标识（etag）
+    
+    每次调用先执行一次很轻的版本查询，版本未变化时直接返回缓存的表列表，
+    只有表或表描述发生变化时才重新执行完整的表查询
+    
+    Args:
+        schema: 架构名，默认为dbo
         
-        print(f"成功获取 {len(tables)} 个表")
+    Returns:
+        包含表列表和etag的字典
+    """
+    error_msg = _validate_identifier(schema, "架构名")
+    if error_msg:
+        logger.warning(error_msg)
         return {
-            "tables": tables,
-            "count": len(tables)
+            "error": error_msg,
+            "schema": schema
         }
+
+    cache_key = ("tables_etag", schema)
+    try:
+        error_msg = _check_schema_exists(schema)
+        if error_msg:
+            logger.warning(error_msg)
+            return {
+                "error": error_msg,
+                "schema": schema
+            }
+
+        with _raw_connection() as conn:
+            version = _fetch_result_sets(conn, _TABLES_VERSION_SQL, (schema,))[0][0]
+            etag = f"{version['table_count']}-{version['tables_checksum'] or 0}"
+            cached = _cache_get(cache_key, config.METADATA_CACHE_TTL)
+            if cached is not None and cached["etag"] == etag:
+                return cached
+            logger.info("架构 '%s' 的表列表已变化，重新查询", schema)
+            tables_info = dict(_query_tables(conn, schema), schema=schema, etag=etag)
+        _cache_set(cache_key, tables_info)
+        return tables_info
     except Exception as e:
-        error_msg = f"列出表失败: {str(e)}"
-        print(f"{error_msg}, 架构: {schema}")
+        logger.error("列出表失败: %s, 架构: %s", e, schema)
         return {
             "error": str(e),
             "schema": schema
         }
 
+# 数据库版本、数据库名称和架构信息合并为一个批处理，一次往返返回；
+# 批处理只有SELECT，不需要SET NOCOUNT ON（不带参数的批处理中SET会残留在连接池的连接上）
+_DATABASE_INFO_SQL = ";\n".join([
+    "SELECT @@VERSION AS version, DB_NAME() AS database_name",
+    "SELECT name AS schema_name FROM sys.schemas WITH (NOLOCK) ORDER BY name"
+])
+
 def get_database_info() -> Dict[str, Any]:
     """获取数据库基本信息
     
     Returns:
         包含数据库信息的字典
     """
+    cache_key = ("database_info",)
+    cached = _cache_get(cache_key, config.DATABASE_INFO_CACHE_TTL)
+    if cached is not None:
+        return cached
+
     try:
-        print("获取数据库基本信息")
-        engine = get_db_connection()
+        logger.info("获取数据库基本信息")
+        with _raw_connection() as conn:
+            info_rows, schema_rows = _fetch_result_sets(conn, _DATABASE_INFO_SQL)
         
-        # 获取数据库版本信息
-        version_sql = "SELECT @@VERSION AS version"
-        # 获取数据库名称
-        db_name_sql = "SELECT DB_NAME() AS database_name"
-        # 获取架构信息
-        schema_sql = "SELECT name AS schema_name FROM sys.schemas ORDER BY name"
+        # 获取版本信息和数据库名称
+        info = info_rows[0] if info_rows else {}
+        version_info = info.get("version")
+        database_name = info.get("database_name")
         
-        with engine.connect() as conn:
-            # 获取版本信息
-            version_result = conn.execute(text(version_sql)).fetchone()
-            version_info = version_result[0] if version_result else None
-            
-            # 获取数据库名称
-            db_name_result = conn.execute(text(db_name_sql)).fetchone()
-            database_name = db_name_result[0] if db_name_result else None
-            
-            # 获取架构信息
-            schema_result = conn.execute(text(schema_sql))
-            schemas = [row[0] for row in schema_result]
+        # 获取架构信息
+        schemas = [row["schema_name"] for row in schema_rows]
         
-        print(f"成功获取数据库信息: {database_name}")
-        return {
+        logger.info("成功获取数据库信息: %s", database_name)
+        database_info = {
             "database_name": database_name,
             "version": version_info,
             "schemas": schemas,
@@ -459,9 +845,10 @@ def get_database_info() -> Dict[str, Any]:
                 "user": config.DB_USER
             }
         }
+        _cache_set(cache_key, database_info)
+        return database_info
     except Exception as e:
-        error_msg = f"获取数据库信息失败: {str(e)}"
-        print(error_msg)
+        logger.error("获取数据库信息失败: %s", e)
         return {
             "error": str(e)
         }
\ No newline at end of file
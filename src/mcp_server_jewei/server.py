@@ -3,39 +3,48 @@
 MCP服务器主模块，提供SQL Server查询和表结构查询功能
 """
 
-from typing import Dict, Any
-from fastmcp import FastMCP
+import logging
+import sys
+import threading
+from typing import Any, Dict, Optional
 
-from typing import Dict, Any
+import anyio
 from fastmcp import FastMCP
-from sqlalchemy import text
 from pydantic import Field
 
 from .app_config import config
-from .core import execute_query, get_table_info, get_db_connection, list_show_tables, get_database_info
+from .core import execute_query, get_table_info, list_show_tables, get_database_info, clear_metadata_cache, get_schema_snapshot_info, get_tables_with_etag, warm_up_connection_pool
+
+logger = logging.getLogger(__name__)
 
 # 创建MCP服务器实例
 mcp = FastMCP(name=config.SERVER_NAME)
 
+# 数据库访问基于同步的pyodbc驱动，工具函数中统一放到工作线程执行，
+# 避免阻塞事件循环，使并发的工具调用可以同时等待数据库返回
+
 @mcp.tool()
-def query_sql(sql: str) -> Dict[str, Any]:
+async def query_sql(sql: str, max_rows: int = config.QUERY_MAX_ROWS, read_uncommitted: bool = False) -> Dict[str, Any]:
     """执行SQL查询并返回结果集（仅支持SELECT语句）
     
     Args:
         sql: SQL查询语句（必须是SELECT语句，）
+        max_rows: 最多返回的行数，超出部分会被截断
+        read_uncommitted: 是否不等待行锁读取（相当于WITH (NOLOCK)，可能读到未提交的数据）
         
     Returns:
         包含查询结果的字典，格式为：
         {
             "columns": [列名列表],
             "rows": [行数据列表],
-            "row_count": 结果行数
+            "row_count": 结果行数,
+            "truncated": 结果是否因超出max_rows被截断
         }
     """
-    return execute_query(sql)
+    return await anyio.to_thread.run_sync(execute_query, sql, max_rows, read_uncommitted)
 
 @mcp.tool()
-def get_table_structure(table_name: str, schema: str = "dbo") -> Dict[str, Any]:
+async def get_table_structure(table_name: str, schema: str = "dbo") -> Dict[str, Any]:
     """获取指定表的结构信息
     
     Args:
@@ -51,12 +60,12 @@ def get_table_structure(table_name: str, schema: str = "dbo") -> Dict[str, Any]:
             "indexes": [索引信息列表]
         }
     """
-    return get_table_info(table_name, schema)
+    return await anyio.to_thread.run_sync(get_table_info, table_name, schema)
 
 
 
 @mcp.tool()
-def list_tables(schema: str = "dbo") -> Dict[str, Any]:
+async def list_tables(schema: str = "dbo") -> Dict[str, Any]:
     """列出数据库中的所有表
     
     Args:
@@ -69,9 +78,66 @@ def list_tables(schema: str = "dbo") -> Dict[str, Any]:
             "count": 表数量
         }
     """
-    return list_show_tables(schema)
+    return await anyio.to_thread.run_sync(list_show_tables, schema)
 
 
+@mcp.tool()
+async def database_info() -> Dict[str, Any]:
+    """获取数据库基本信息（版本、当前数据库名、架构列表）
+    
+    Returns:
+        包含数据库信息的字典，格式为：
+        {
+            "database_name": 数据库名,
+            "version": 版本信息,
+            "schemas": [架构名列表],
+            "connection": {连接信息}
+        }
+    """
+    return await anyio.to_thread.run_sync(get_database_info)
+
+
+@mcp.tool()
+async def get_schema_snapshot(schema: str = "dbo") -> Dict[str, Any]:
+    """一次性获取架构中所有表的结构信息（避免逐表调用get_table_structure）
+    
+    Args:
+        schema: 架构名，默认为dbo
+        
+    Returns:
+        包含所有表结构信息的字典，格式为：
+        {
+            "schema": 架构名,
+            "tables": {表名: {"columns": [...], "primary_keys": [...], "foreign_keys": [...], "indexes": [...]}},
+            "count": 表数量
+        }
+    """
+    return await anyio.to_thread.run_sync(get_schema_snapshot_info, schema)
+
+
+@mcp.tool()
+def refresh_metadata(schema: Optional[str] = None, table_name: Optional[str] = None) -> Dict[str, Any]:
+    """清除表结构、表列表等元数据缓存（表结构变更后调用）
+    
+    Args:
+        schema: 架构名，为空时清除全部缓存
+        table_name: 表名，指定时只清除该表的结构缓存和所在架构的结构快照
+        
+    Returns:
+        包含清除结果的字典，格式为：
+        {
+            "cleared": 清除的缓存条目数量
+        }
+    """
+    return {"cleared": clear_metadata_cache(schema, table_name)}
+
+
+# sql语句编写规范，内容固定，导入时构建一次
+_SQL_DESCRIBE = '''
+    1：SQL语句必须
+
+'''
+
 @mcp.resource(
     uri="data://sql_describe",      # Explicit URI (required)
     name="sql语句编写规范",     # Custom name
@@ -81,11 +147,21 @@ def list_tables(schema: str = "dbo") -> Dict[str, Any]:
 )
 def sql_describe() -> str:
     """sql语句编写规范和说明（在编写sql语句前必看）"""
-    ret = f'''
-    1：SQL语句必须
+    return _SQL_DESCRIBE
 
-'''
-    return ret
+@mcp.resource(
+    uri="data://tables/{schema}",
+    name="表列表",
+    description="架构中的所有表（JSON），etag在表或表描述变化时改变，可与上次读取的etag比较判断表列表是否变化",
+    mime_type="application/json",
+    tags={"元数据"}
+)
+async def tables_resource(schema: str) -> Dict[str, Any]:
+    """架构中的所有表及其版本标识"""
+    return await anyio.to_thread.run_sync(get_tables_with_etag, schema)
+
+# 问好提示词模板
+_INTRODUCTION_TEMPLATE = "用户名叫 '{user_name}' ，你需要友好的回复对方的问好，需要有Emoji表情，且要使用中文 ."
 
 @mcp.prompt(
     name="introduction",  # Custom prompt name
@@ -96,14 +172,66 @@ def introduction_prompt(
     user_name: str = Field(description="用户姓名，非必填")
 ) -> str:
     """当用户问好时，需要生成的用户消息."""
-    return f"用户名叫 '{user_name}' ，你需要友好的回复对方的问好，需要有Emoji表情，且要使用中文 ."
+    return _INTRODUCTION_TEMPLATE.format(user_name=user_name)
+
+def _warm_up():
+    """后台预热数据库连接池"""
+    try:
+        warm_up_connection_pool()
+    except Exception as e:
+        logger.warning("连接池预热失败: %s", e)
+
+def _start_warm_up():
+    """在后台预热连接池，不阻塞MCP握手；数据库不可用时只记录日志"""
+    if config.DB_POOL_WARM_UP:
+        threading.Thread(target=_warm_up, name="db-pool-warm-up", daemon=True).start()
+
+def _configure_logging():
+    """配置日志输出"""
+    # 日志输出到stderr，避免破坏STDIO传输使用的stdout
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    # LOG_LEVEL只作用于本项目的日志，第三方库（SQLAlchemy、FastMCP等）保持WARNING，
+    # 调低日志级别排查问题时不会被大量库内部日志淹没
+    logging.getLogger(__package__).setLevel(config.LOG_LEVEL)
+
+def create_http_app():
+    """创建Streamable HTTP传输的ASGI应用，uvicorn的每个worker进程各调用一次"""
+    _configure_logging()
+    _start_warm_up()
+    # 多个worker进程之间不共享会话状态，使用无状态模式使任意worker都能处理请求
+    return mcp.http_app(stateless_http=config.MCP_WORKERS > 1)
+
+# 支持的传输方式
+_TRANSPORTS = ("stdio", "http")
 
 def main():
     """主函数，用于启动MCP服务器"""
-    print("启动 MSSQL MCP 服务器...")
-    mcp.run()
-    # To use a different transport, e.g., HTTP:
-    # mcp.run(transport="streamable-http", host="127.0.0.1", port=9000)
+    if config.MCP_TRANSPORT not in _TRANSPORTS:
+        raise SystemExit(f"不支持的MCP_TRANSPORT: {config.MCP_TRANSPORT!r}（可选值: {', '.join(_TRANSPORTS)}）")
+    _configure_logging()
+    logger.info("启动 MSSQL MCP 服务器...")
+    if config.MCP_TRANSPORT == "stdio":
+        _start_warm_up()
+        mcp.run()
+        return
+
+    import uvicorn
+
+    # loop/http为auto时，安装了uvloop、httptools（uvicorn[standard]）会自动使用，否则回退到asyncio、h11；
+    # 每个worker进程各自维护一个连接池
+    uvicorn.run(
+        f"{__package__}.server:create_http_app",
+        factory=True,
+        host=config.MCP_HOST,
+        port=config.MCP_PORT,
+        workers=config.MCP_WORKERS,
+        loop="auto",
+        http="auto"
+    )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
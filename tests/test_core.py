@@ -1,12 +1,18 @@
 # tests/test_core.py
 import unittest
+import datetime
 import os
 import sys
+import uuid
+from decimal import Decimal
+from contextlib import contextmanager, nullcontext
+from unittest.mock import patch
 
 # 添加源代码目录到路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.mcp_server_jewei import __version__
+from src.mcp_server_jewei import core
 
 class TestCore(unittest.TestCase):
     """基本测试类"""
@@ -18,10 +24,366 @@ class TestCore(unittest.TestCase):
     def test_import(self):
         """测试是否可以正确导入模块"""
         try:
-            from src.mcp_server_jewei import server
+            from src.mcp_server_jewei import server  # noqa: F401
             self.assertTrue(True)
         except ImportError:
             self.fail("导入模块失败")
 
+
+class TestMetadataCache(unittest.TestCase):
+    """元数据缓存测试类"""
+
+    def setUp(self):
+        core.clear_metadata_cache()
+
+    def test_cache_hit_and_expire(self):
+        """测试缓存命中与过期"""
+        core._cache_set(("table", "dbo", "users"), {"columns": []})
+        self.assertEqual(core._cache_get(("table", "dbo", "users"), 60), {"columns": []})
+        self.assertIsNone(core._cache_get(("table", "dbo", "users"), -1))
+        self.assertIsNone(core._cache_get(("table", "dbo", "users"), 60))
+
+    def test_evict_oldest_when_full(self):
+        """测试超出容量时淘汰最早写入的条目"""
+        maxsize = core.config.METADATA_CACHE_MAXSIZE
+        for i in range(maxsize + 1):
+            core._cache_set(("tables", f"schema_{i}"), {})
+        self.assertIsNone(core._cache_get(("tables", "schema_0"), 60))
+        self.assertIsNotNone(core._cache_get(("tables", f"schema_{maxsize}"), 60))
+
+    def test_clear_by_schema(self):
+        """测试按架构清除缓存"""
+        core._cache_set(("table", "dbo", "users"), {})
+        core._cache_set(("tables", "dbo"), {})
+        core._cache_set(("tables", "sales"), {})
+        self.assertEqual(core.clear_metadata_cache("dbo"), 2)
+        self.assertIsNotNone(core._cache_get(("tables", "sales"), 60))
+
+class TestValidateIdentifier(unittest.TestCase):
+    """标识符校验测试类"""
+
+    def test_valid_identifiers(self):
+        """测试合法的表名和架构名，包括需要用方括号分隔的名称"""
+        for name in ["users", "_tmp", "Order Details", "用户表", "t$1",
+                     "2023_sales", "order-items", "Order.Details", "x" * 128]:
+            self.assertIsNone(core._validate_identifier(name, "表名"), name)
+
+    def test_invalid_identifiers(self):
+        """测试空值、超长或非字符串的名称"""
+        for name in ["", "x" * 129, None]:
+            self.assertIsNotNone(core._validate_identifier(name, "表名"), name)
+
+    def test_get_table_info_rejects_invalid_name(self):
+        """测试非法表名不会访问数据库"""
+        result = core.get_table_info("")
+        self.assertIn("error", result)
+
+
+class TestCheckReadOnlySql(unittest.TestCase):
+    """只读SQL校验测试类"""
+
+    def test_allowed_queries(self):
+        """测试允许的只读查询"""
+        for sql in [
+            "SELECT TOP 10 update_time, create_by FROM orders",
+            "WITH x AS (SELECT 1 AS a) SELECT * FROM x",
+            "SELECT 1 UNION SELECT 2",
+            "SELECT * FROM [Order Details];",
+            "SELECT * FROM orders; -- done",
+            "SELECT [delete], 'DROP TABLE x' AS note, N'kill' AS [shutdown] FROM orders",
+        ]:
+            self.assertIsNone(core._check_read_only_sql(sql), sql)
+
+    def test_rejected_queries(self):
+        """测试写操作、多语句、存储过程调用和无法分词的语句被拒绝"""
+        for sql in [
+            "DELETE FROM orders",
+            "SELECT 1; DROP TABLE orders",
+            "SELECT * INTO orders_bak FROM orders",
+            "EXEC sp_who",
+            "UPDATE orders SET status = 1",
+            "SELECT 'abc",
+            "SELECT 1 DELETE FROM orders",
+            "SELECT 1 DELETE FROM orders WHERE 1=1",
+            "SELECT 1 SHUTDOWN",
+            "SELECT 1 CHECKPOINT",
+            "SELECT 1 KILL",
+            "SELECT 1 BACKUP",
+            "SELECT 1 RESTORE",
+            "SELECT 1 DENY",
+            "SELECT 1 DBCC",
+            "SELECT * FROM OPENQUERY(srv, 'DELETE FROM orders')",
+            "SELECT * FROM OPENROWSET('SQLNCLI', 'Server=x;', 'SELECT 1')",
+            "SELECT * FROM OPENDATASOURCE('SQLNCLI', 'Data Source=x').db.dbo.t",
+        ]:
+            self.assertIsNotNone(core._check_read_only_sql(sql), sql)
+
+
+class TestBuildGuardedQuery(unittest.TestCase):
+    """查询保护语句测试类"""
+
+    def test_guards_precede_query(self):
+        """测试保护性SET语句位于用户查询之前"""
+        batch = core._build_guarded_query("SELECT * FROM orders")
+        self.assertIn("SET ROWCOUNT @max_rows", batch)
+        self.assertNotIn("READ UNCOMMITTED", batch)
+        self.assertTrue(batch.endswith("SELECT * FROM orders"))
+
+    def test_read_uncommitted(self):
+        """测试可选的READ UNCOMMITTED隔离级别"""
+        batch = core._build_guarded_query("SELECT 1", read_uncommitted=True)
+        self.assertIn("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED", batch)
+
+
+class _FakeMappingResult:
+    """模拟SQLAlchemy的CursorResult及其mappings()，按需逐行返回"""
+
+    def __init__(self, columns, rows):
+        self._columns = columns
+        self._rows = [dict(zip(columns, row)) for row in rows]
+        self.closed = False
+
+    def keys(self):
+        return list(self._columns)
+
+    def mappings(self):
+        return self
+
+    def fetchmany(self, size):
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeEngine:
+    """模拟SQLAlchemy引擎，connect()返回记录执行参数的连接"""
+
+    def __init__(self, result):
+        self.result = result
+        self.executed = None
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def exec_driver_sql(self, sql, params):
+        self.executed = (sql, params)
+        return self.result
+
+
+class TestExecuteQuery(unittest.TestCase):
+    """query_sql执行测试类"""
+
+    def _execute(self, row_count, max_rows):
+        rows = [(i, Decimal("1.5")) for i in range(row_count)]
+        engine = _FakeEngine(_FakeMappingResult(["id", "amount"], rows))
+        with patch.object(core, "get_db_connection", return_value=engine):
+            result = core.execute_query("SELECT id, amount FROM orders", max_rows=max_rows)
+        return result, engine
+
+    def test_guarded_query_parameters(self):
+        """测试用户查询放入保护批处理执行，并多取一行用于判断截断"""
+        result, engine = self._execute(1, 3)
+        self.assertEqual(engine.executed, (
+            core._GUARDED_QUERY_SQL,
+            (core._build_guarded_query("SELECT id, amount FROM orders"), 4)
+        ))
+        self.assertTrue(engine.result.closed)
+        self.assertEqual(result["columns"], ["id", "amount"])
+        self.assertEqual(result["rows"], [{"id": 0, "amount": "1.5"}])
+
+    def test_exactly_max_rows_not_truncated(self):
+        """测试恰好返回max_rows行时不标记为截断"""
+        result, _ = self._execute(3, 3)
+        self.assertEqual(result["row_count"], 3)
+        self.assertFalse(result["truncated"])
+
+    def test_more_than_max_rows_truncated(self):
+        """测试返回max_rows + 1行时只保留max_rows行并标记为截断"""
+        result, _ = self._execute(4, 3)
+        self.assertEqual(len(result["rows"]), 3)
+        self.assertTrue(result["truncated"])
+
+    def test_rejects_out_of_range_max_rows(self):
+        """测试max_rows不大于0或超过上限时直接返回错误，不访问数据库"""
+        with patch.object(core.config, "QUERY_MAX_ROWS_LIMIT", 100):
+            for max_rows in [0, -1, 101, 2 ** 31]:
+                result = core.execute_query("SELECT 1", max_rows=max_rows)
+                self.assertIn("max_rows", result["error"], max_rows)
+                self.assertEqual(result["sql"], "SELECT 1")
+
+
+class TestCoerce(unittest.TestCase):
+    """查询结果值转换测试类"""
+
+    def test_coerce_values(self):
+        """测试二进制、Decimal、日期时间和UUID转换为字符串，其余原样返回"""
+        value_id = uuid.UUID("12345678-1234-5678-1234-567812345678")
+        self.assertEqual(core._coerce(b"\x01\xff"), "0x01FF")
+        self.assertEqual(core._coerce(Decimal("12.50")), "12.50")
+        self.assertEqual(core._coerce(datetime.datetime(2024, 1, 2, 3, 4, 5)), "2024-01-02T03:04:05")
+        self.assertEqual(core._coerce(datetime.date(2024, 1, 2)), "2024-01-02")
+        self.assertEqual(core._coerce(value_id), str(value_id))
+        for value in [1, 1.5, "text", True, None]:
+            self.assertIs(core._coerce(value), value)
+
+
+class TestCheckSchemaExists(unittest.TestCase):
+    """架构校验测试类"""
+
+    def setUp(self):
+        core.clear_metadata_cache()
+        core._cache_set(("schemas",), {"names": frozenset({"dbo", "sales"})})
+
+    def tearDown(self):
+        core.clear_metadata_cache()
+
+    def test_known_schema(self):
+        """测试已知架构（忽略大小写）通过校验"""
+        self.assertIsNone(core._check_schema_exists("dbo"))
+        self.assertIsNone(core._check_schema_exists("Sales"))
+
+    def test_unknown_schema(self):
+        """测试未知架构直接返回错误，不访问数据库"""
+        self.assertIsNotNone(core._check_schema_exists("hr"))
+        result = core.list_show_tables("hr")
+        self.assertIn("error", result)
+        self.assertEqual(result["schema"], "hr")
+
+    def test_table_refresh_clears_schema_snapshot(self):
+        """测试按表清除缓存时也会清除所在架构的结构快照"""
+        core._cache_set(("table", "sales", "orders"), {"columns": []})
+        core._cache_set(("snapshot", "sales"), {"tables": {}})
+        core._cache_set(("snapshot", "dbo"), {"tables": {}})
+        core.clear_metadata_cache(schema="sales", table_name="orders")
+        self.assertIsNone(core._cache_get(("table", "sales", "orders"), 60))
+        self.assertIsNone(core._cache_get(("snapshot", "sales"), 60))
+        self.assertIsNotNone(core._cache_get(("snapshot", "dbo"), 60))
+
+    def test_targeted_refresh_clears_schema_names(self):
+        """测试按架构或按表清除缓存时也会清除架构名集合"""
+        self.assertEqual(core.clear_metadata_cache(schema="sales"), 1)
+        self.assertIsNone(core._cache_get(("schemas",), 60))
+        core._cache_set(("schemas",), {"names": frozenset({"dbo"})})
+        core.clear_metadata_cache(schema="dbo", table_name="users")
+        self.assertIsNone(core._cache_get(("schemas",), 60))
+
+
+class _FakeCursor:
+    """模拟pyodbc游标，按顺序返回多个结果集"""
+
+    def __init__(self, result_sets):
+        self._result_sets = list(result_sets)
+        self.executed = None
+        self.closed = False
+
+    @property
+    def description(self):
+        columns, _ = self._result_sets[0]
+        return None if columns is None else [(name,) for name in columns]
+
+    def execute(self, sql, *params):
+        self.executed = (sql, params)
+
+    def fetchall(self):
+        return self._result_sets[0][1]
+
+    def nextset(self):
+        self._result_sets.pop(0)
+        return bool(self._result_sets)
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+class TestFetchResultSets(unittest.TestCase):
+    """批处理结果集读取测试类"""
+
+    def test_multiple_result_sets(self):
+        """测试跳过无结果集的语句并按顺序读取全部结果集"""
+        cursor = _FakeCursor([
+            (None, []),
+            (["name"], [("id",), ("title",)]),
+            (["column_name"], [("id",)]),
+        ])
+        result_sets = core._fetch_result_sets(_FakeConnection(cursor), "SELECT 1; SELECT 2")
+        self.assertEqual(result_sets, [
+            [{"name": "id"}, {"name": "title"}],
+            [{"column_name": "id"}],
+        ])
+        self.assertTrue(cursor.closed)
+
+
+class TestTablesEtag(unittest.TestCase):
+    """表列表版本标识测试类"""
+
+    def setUp(self):
+        core.clear_metadata_cache()
+        core._cache_set(("schemas",), {"names": frozenset({"dbo"})})
+
+    def tearDown(self):
+        core.clear_metadata_cache()
+
+    def _get(self, version, tables_info):
+        with patch.object(core, "_raw_connection", return_value=nullcontext(object())), \
+                patch.object(core, "_fetch_result_sets", return_value=[[version]]), \
+                patch.object(core, "_query_tables", return_value=tables_info) as query_tables:
+            return core.get_tables_with_etag("dbo"), query_tables.call_count
+
+    def test_unchanged_version_uses_cache(self):
+        """测试版本未变化时不重新查询表列表，变化时重新查询"""
+        version = {"table_count": 1, "tables_checksum": -123456}
+        first, calls = self._get(version, {"tables": [{"table_name": "users"}], "count": 1})
+        self.assertEqual(calls, 1)
+        self.assertEqual(first["etag"], "1--123456")
+        second, calls = self._get(version, {"tables": [], "count": 0})
+        self.assertEqual(calls, 0)
+        self.assertEqual(second, first)
+        changed, calls = self._get({"table_count": 0, "tables_checksum": None}, {"tables": [], "count": 0})
+        self.assertEqual(calls, 1)
+        self.assertEqual(changed["etag"], "0-0")
+
+
+class TestBuildTableStructures(unittest.TestCase):
+    """表结构结果集分组测试类"""
+
+    def test_group_by_table(self):
+        """测试按表分组并合并同一索引的多个列"""
+        columns_rows = [
+            {"table_name": "orders", "column_name": "id", "data_type": "int", "max_length": 4,
+             "precision": 10, "scale": 0, "is_nullable": 0, "description": ""},
+            {"table_name": "users", "column_name": "id", "data_type": "int", "max_length": 4,
+             "precision": 10, "scale": 0, "is_nullable": 0, "description": "主键"},
+        ]
+        primary_keys_rows = [{"table_name": "users", "column_name": "id"}]
+        indexes_rows = [
+            {"table_name": "orders", "index_id": 0, "index_name": None, "index_type": "HEAP",
+             "is_unique": 0, "is_primary_key": 0, "is_unique_constraint": 0, "column_name": None},
+            {"table_name": "users", "index_id": 2, "index_name": "ix_name", "index_type": "NONCLUSTERED",
+             "is_unique": 1, "is_primary_key": 0, "is_unique_constraint": 0, "column_name": "first_name"},
+            {"table_name": "users", "index_id": 2, "index_name": "ix_name", "index_type": "NONCLUSTERED",
+             "is_unique": 1, "is_primary_key": 0, "is_unique_constraint": 0, "column_name": "last_name"},
+        ]
+        structures = core._build_table_structures(columns_rows, primary_keys_rows, [], indexes_rows)
+        self.assertEqual(sorted(structures), ["orders", "users"])
+        self.assertEqual(structures["users"]["primary_keys"], ["id"])
+        self.assertIs(structures["users"]["columns"][0]["is_nullable"], False)
+        self.assertEqual(structures["orders"]["indexes"][0]["columns"], [])
+        self.assertEqual(structures["users"]["indexes"][0]["columns"], ["first_name", "last_name"])
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file